@@ -6,75 +6,515 @@ Enhanced field updates from Crossref API
 """
 
 import argparse
+import logging
+import sys
 import bibtexparser
 import requests
 import time
 import re
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from difflib import SequenceMatcher
 from bibtexparser.bwriter import BibTexWriter
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from typing import NamedTuple, Optional, Tuple
+from urllib.parse import quote
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-def similar(a, b):
-    """Calculate similarity ratio between two strings."""
-    return SequenceMatcher(None, a.lower(), b.lower()).ratio()
+# RapidFuzz is optional; fall back to difflib when it is not installed
+try:
+    from rapidfuzz import fuzz, process
+except ImportError:
+    fuzz = process = None
+
+# rapidfuzz.process.cdist returns NumPy arrays, so only use it when NumPy is present
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# orjson is optional; it decodes Crossref responses faster than the json module
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+# requests-cache is optional; without it Crossref responses are not cached on disk
+try:
+    import requests_cache
+except ImportError:
+    requests_cache = None
+
+logger = logging.getLogger('fix_bib')
+
+class EntryLogAdapter(logging.LoggerAdapter):
+    """
+    Prefix messages with a label such as "[3/120] smith2019machine", so lines
+    from concurrent workers can be traced back to their entry.
+    """
+    
+    def process(self, msg, kwargs):
+        return f"  {self.extra['label']}: {msg.strip()}", kwargs
+
+USER_AGENT = 'BibtexFixer/6.0 (mailto:example@example.com)'
+CROSSREF_WORKS_URL = 'https://api.crossref.org/works'
+
+# Only the fields extract_metadata() and the ranking read, to keep search responses small
+CROSSREF_SELECT_FIELDS = ('DOI,title,author,container-title,volume,issue,page,published-print,'
+                          'published-online,created,publisher,event,type,URL')
+
+# How often a request is retried after Crossref answers 429 Too Many Requests
+RATE_LIMIT_RETRIES = 5
+
+# Stop ranking Crossref candidates once a match scores at least this high
+EARLY_EXIT_SCORE = 0.97
+
+# Number of DOIs fetched per filter=doi:... request
+DOI_BATCH_SIZE = 40
+
+# A well-formed DOI, e.g. 10.1000/xyz123
+DOI_RE = re.compile(r'^10\.\d{4,9}/\S+$')
+
+# Patterns used by clean_text(), compiled once
+BRACE_RE = re.compile(r'[{}]')
+WHITESPACE_RE = re.compile(r'\s+')
+
+def create_session(cache_file=None, max_connections=8):
+    """
+    Create an HTTP session for Crossref requests.
+    Keeps up to max_connections connections to Crossref alive, one per worker
+    thread, and retries transient failures.
+    If cache_file is given and requests-cache is installed, responses are
+    cached on disk so re-runs do not query Crossref again.
+    """
+    if cache_file and requests_cache:
+        session = requests_cache.CachedSession(cache_file, expire_after=timedelta(days=30),
+                                               allowable_methods=['GET'], stale_if_error=True)
+    else:
+        session = requests.Session()
+    # 429 is handled by crossref_get() so that all workers back off together;
+    # urllib3 would otherwise still retry any 429 that carries Retry-After
+    retries = Retry(total=5, backoff_factor=1, status_forcelist=[500, 502, 503, 504],
+                    respect_retry_after_header=False)
+    # All requests go to one host, so a single pool sized to the worker count
+    # lets every thread reuse its own kept-alive connection
+    session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=max_connections,
+                                          pool_block=True, max_retries=retries))
+    session.headers.update({'User-Agent': USER_AGENT})
+    return session
+
+class RateLimiter:
+    """
+    Token bucket shared by all worker threads.
+    The rate is taken from the X-Rate-Limit-* headers Crossref sends back,
+    and pause() holds back every worker after a 429.
+    """
+    
+    def __init__(self, limit=50, interval=1.0):
+        self._lock = threading.Lock()
+        self._rate = limit / interval
+        self._capacity = limit
+        self._tokens = float(limit)
+        self._last = time.monotonic()
+        self._paused_until = 0.0
+    
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self._capacity, self._tokens + (now - self._last) * self._rate)
+        self._last = now
+    
+    def acquire(self):
+        """Take one token, sleeping until it becomes available."""
+        with self._lock:
+            self._refill()
+            # Reserve the token now so concurrent callers queue up behind us
+            self._tokens -= 1
+            wait = -self._tokens / self._rate if self._tokens < 0 else 0
+            # Everyone waits out a back-off requested after a 429
+            wait = max(wait, self._paused_until - self._last)
+        if wait > 0:
+            time.sleep(wait)
+    
+    def update_from_headers(self, headers):
+        """Adjust the rate from the limits advertised in a Crossref response."""
+        try:
+            limit = int(headers['X-Rate-Limit-Limit'])
+            interval = parse_interval(headers['X-Rate-Limit-Interval'])
+        except (KeyError, ValueError):
+            return
+        if limit <= 0 or interval <= 0:
+            return
+        with self._lock:
+            self._refill()
+            self._rate = limit / interval
+            self._capacity = limit
+            self._tokens = min(self._tokens, self._capacity)
+    
+    def pause(self, seconds):
+        """Hold back all requests for the given number of seconds."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+def parse_interval(value):
+    """Parse a rate-limit interval such as '1s', '2m' or '1' into seconds."""
+    value = value.strip().lower()
+    units = {'s': 1, 'm': 60, 'h': 3600}
+    if value and value[-1] in units:
+        return float(value[:-1]) * units[value[-1]]
+    return float(value)
+
+def retry_after_seconds(headers, default):
+    """Read the delay from a Retry-After header (seconds or HTTP date), or return default."""
+    value = headers.get('Retry-After')
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return default
+
+def _best_ratios(text, candidates):
+    """
+    Compare text against each candidate with difflib, reusing one matcher.
+    SequenceMatcher caches its index of seq2, so text is kept there and only
+    seq1 changes per candidate.
+    """
+    matcher = SequenceMatcher(None, '', text, autojunk=False)
+    scores = []
+    for candidate in candidates:
+        matcher.set_seq1(candidate)
+        scores.append(matcher.ratio())
+    return scores
+
+def title_similarities(title_lc, candidates):
+    """
+    Calculate similarity of a lowercased title against every candidate title.
+    Each candidate is lowercased once here.
+    """
+    candidates_lc = [candidate.lower() for candidate in candidates]
+    if process:
+        scores = [0.0] * len(candidates_lc)
+        for _, score, index in process.extract(title_lc, candidates_lc, scorer=fuzz.ratio, limit=None):
+            scores[index] = score / 100.0
+        return scores
+    return _best_ratios(title_lc, candidates_lc)
+
+def name_key(name):
+    """Normalize an author name so "Last, First" and "First Last" compare equal."""
+    return ' '.join(sorted(name.replace(',', ' ').lower().split()))
+
+def author_similarity(author_key, candidate_keys):
+    """Calculate best similarity of a normalized author name against normalized candidates."""
+    if not candidate_keys:
+        return 0
+    if process:
+        return process.extractOne(author_key, candidate_keys, scorer=fuzz.ratio)[1] / 100.0
+    return max(_best_ratios(author_key, candidate_keys))
+
+def author_match_score(author_keys, candidate_keys):
+    """
+    Calculate how well a list of authors matches candidate author names.
+    Both lists must already be normalized with name_key().
+    Returns the average of each author's best similarity.
+    """
+    if process and numpy is not None:
+        if not candidate_keys:
+            return 0
+        # Score the whole authors x candidates matrix in one call
+        scores = process.cdist(author_keys, candidate_keys, scorer=fuzz.ratio)
+        return float(scores.max(axis=1).mean()) / 100.0
+    author_matches = [author_similarity(author_key, candidate_keys) for author_key in author_keys]
+    return sum(author_matches) / len(author_matches)
 
 def clean_text(text):
     """Clean text by removing unnecessary characters and normalizing whitespace."""
     if not text:
         return ""
     # Remove curly braces, normalize whitespace
-    text = re.sub(r'[{}]', '', text)
-    text = re.sub(r'\s+', ' ', text).strip()
+    text = BRACE_RE.sub('', text)
+    text = WHITESPACE_RE.sub(' ', text).strip()
     return text
 
-def get_doi_from_crossref(entry, similarity_threshold=0.75, max_results=10):
+class EntryView(NamedTuple):
     """
-    Query Crossref API to find DOI and standardized metadata.
-    Returns a tuple of (doi, metadata_dict) where metadata_dict contains updated fields.
+    The fields of a BibTeX entry used for Crossref lookups, parsed and
+    normalized once per entry.
     """
-    # Extract data from entry
-    title = clean_text(entry.get('title', ''))
-    authors = entry.get('author', '').split(' and ')
-    year = entry.get('year', '')
+    title: str
+    title_lc: str
+    authors: Tuple[str, ...]
+    author_keys: Tuple[str, ...]
+    first_author_lastname: str
+    year: str
+    doi: Optional[str]
     
-    # Build initial query with title
-    query = title
-    
-    # Create more specific query if possible
-    if authors and len(authors) > 0:
+    @classmethod
+    def from_entry(cls, entry):
+        """Build the view of a bibtexparser entry dict."""
+        title = clean_text(entry.get('title', ''))
+        authors = tuple(author.strip() for author in entry.get('author', '').split(' and ') if author.strip())
+        
         # Extract last name of first author
-        first_author_lastname = authors[0].split(',')[0] if ',' in authors[0] else authors[0].split()[-1]
-        query = f"{first_author_lastname} {title}"
+        first_author_lastname = ''
+        if authors:
+            first_author_lastname = authors[0].split(',')[0] if ',' in authors[0] else authors[0].split()[-1]
+        
+        return cls(
+            title=title,
+            title_lc=title.lower(),
+            authors=authors,
+            author_keys=tuple(name_key(author) for author in authors),
+            first_author_lastname=first_author_lastname,
+            year=entry.get('year', ''),
+            doi=entry.get('doi', '').strip() or None,
+        )
+
+def extract_metadata(item):
+    """
+    Extract BibTeX fields from a Crossref work record.
+    Returns a dict of field name to value.
+    """
+    metadata = {}
+    # Title
+    metadata['title'] = item['title'][0]
+    
+    # Journal/container title
+    if 'container-title' in item and item['container-title']:
+        metadata['journal'] = item['container-title'][0]
+    
+    # Volume
+    if 'volume' in item:
+        metadata['volume'] = item['volume']
+    
+    # Issue/Number
+    if 'issue' in item:
+        metadata['number'] = item['issue']
+    
+    # Pages
+    if 'page' in item:
+        metadata['pages'] = item['page'].replace('-', '--')  # BibTeX format
+    
+    # Year
+    if 'published-print' in item and 'date-parts' in item['published-print']:
+        metadata['year'] = str(item['published-print']['date-parts'][0][0])
+    elif 'published-online' in item and 'date-parts' in item['published-online']:
+        metadata['year'] = str(item['published-online']['date-parts'][0][0])
+    elif 'created' in item and 'date-parts' in item['created']:
+        metadata['year'] = str(item['created']['date-parts'][0][0])
+    
+    # Publisher
+    if 'publisher' in item:
+        metadata['publisher'] = item['publisher']
+    
+    # Book title (for conference papers)
+    if 'event' in item and item['event'].get('name'):
+        metadata['booktitle'] = item['event']['name']
+    
+    # Type - map to BibTeX entry type
+    if 'type' in item:
+        type_mapping = {
+            'journal-article': 'article',
+            'proceedings-article': 'inproceedings',
+            'book-chapter': 'incollection',
+            'book': 'book',
+            'edited-book': 'book',
+            'monograph': 'book',
+            'report': 'techreport',
+            'dissertation': 'phdthesis'
+        }
+        if item['type'] in type_mapping:
+            metadata['ENTRYTYPE'] = type_mapping[item['type']]
+    
+    # URL
+    if 'URL' in item:
+        metadata['url'] = item['URL']
+    
+    return metadata
+
+def crossref_get(session, url, params=None, limiter=None, log=logger):
+    """
+    Send a GET request to Crossref, respecting the shared rate limiter.
+    On HTTP 429 all workers back off for the Retry-After delay (or an
+    exponentially growing one) before the request is retried.
+    Responses already in the on-disk cache skip the rate limiter.
+    """
+    if requests_cache and isinstance(session, requests_cache.CachedSession):
+        # requests-cache answers 504 instead of sending the request on a miss
+        response = session.get(url, params=params, timeout=30, only_if_cached=True)
+        if response.status_code != 504:
+            return response
+    
+    for attempt in range(RATE_LIMIT_RETRIES + 1):
+        if limiter:
+            limiter.acquire()
+        response = session.get(url, params=params, timeout=30)
+        if limiter:
+            limiter.update_from_headers(response.headers)
+        if response.status_code != 429 or attempt == RATE_LIMIT_RETRIES:
+            return response
+        
+        delay = retry_after_seconds(response.headers, default=2 ** attempt)
+        log.warning(f"  ⚠️  Crossref rate limit reached, backing off for {delay:.1f}s")
+        if limiter:
+            limiter.pause(delay)
+        else:
+            time.sleep(delay)
+
+class ResponseCache:
+    """
+    Decoded Crossref responses for one run, so duplicate entries share one
+    request. Concurrent callers asking for the same key wait for the first
+    one instead of sending their own request.
+    """
+    
+    def __init__(self):
+        self._messages = {}
+        self._locks = {}
+        self._guard = threading.Lock()
+    
+    def get(self, key, fetch):
+        """Return the cached value for key, calling fetch() once to fill it."""
+        with self._guard:
+            key_lock = self._locks.setdefault(key, threading.Lock())
+        with key_lock:
+            if key not in self._messages:
+                self._messages[key] = fetch()
+            return self._messages[key]
+
+def crossref_get_message(session, url, params=None, limiter=None, log=logger, responses=None):
+    """
+    Fetch a Crossref URL and return the decoded 'message' part of the response,
+    or None if Crossref answered 404. With a ResponseCache, identical requests
+    are only sent once per run. Failed requests raise and are not cached.
+    """
+    def fetch():
+        response = crossref_get(session, url, params, limiter, log)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return json_loads(response.content)['message']
     
-    print(f"  Searching Crossref for: {query[:60]}...")
+    if responses is None:
+        return fetch()
+    return responses.get((url, tuple(sorted((params or {}).items()))), fetch)
+
+def lookup_doi(session, doi, limiter=None, log=logger, responses=None):
+    """
+    Fetch the Crossref work record for a DOI.
+    Returns the record, or None if Crossref does not know the DOI.
+    Raises RequestException or ValueError if the request fails.
+    """
+    return crossref_get_message(session, f"{CROSSREF_WORKS_URL}/{quote(doi.strip().lower())}",
+                                limiter=limiter, log=log, responses=responses)
+
+def _fetch_doi_batch(session, batch, limiter=None, responses=None):
+    """
+    Fetch the Crossref records for one batch of lowercased DOIs with a single
+    filter=doi:... query. Returns a dict of DOI to record, with None for DOIs
+    Crossref does not know, or an empty dict if the request fails.
+    """
+    params = {
+        'filter': ','.join(f'doi:{doi}' for doi in batch),
+        'rows': len(batch),
+        'select': CROSSREF_SELECT_FIELDS,
+    }
+    log = EntryLogAdapter(logger, {'label': f"[DOI prefetch] {batch[0]} .. {batch[-1]}"})
+    try:
+        message = crossref_get_message(session, CROSSREF_WORKS_URL, params, limiter, log, responses)
+    except (requests.exceptions.RequestException, ValueError) as e:
+        log.error(f"  ❌ API request error: {e}")
+        return {}
+    works = dict.fromkeys(batch)
+    for item in (message or {}).get('items', []):
+        if item.get('DOI'):
+            works[item['DOI'].lower()] = item
+    return works
+
+def prefetch_dois(session, dois, limiter=None, executor=None, batch_size=DOI_BATCH_SIZE, responses=None):
+    """
+    Fetch the Crossref records for many DOIs, batch_size DOIs per request.
+    Returns a dict of lowercased DOI to record (None if Crossref does not know
+    the DOI). DOIs in failed batches are left out so they are looked up again
+    one by one.
+    """
+    # Commas separate filter values, so such DOIs are left to the single lookup
+    unique_dois = sorted({doi.strip().lower() for doi in dois if ',' not in doi})
+    batches = [unique_dois[start:start + batch_size] for start in range(0, len(unique_dois), batch_size)]
+    run = executor.map if executor else map
+    works = {}
+    for batch_works in run(lambda batch: _fetch_doi_batch(session, batch, limiter, responses), batches):
+        works.update(batch_works)
+    logger.debug(f"Prefetched {sum(item is not None for item in works.values())} of {len(unique_dois)} "
+                 f"existing DOIs in {len(batches)} requests")
+    return works
+
+def get_doi_from_crossref(session, view, similarity_threshold=0.75, max_results=10, limiter=None, works=None,
+                          log=logger, responses=None):
+    """
+    Query Crossref API to find DOI and standardized metadata for an EntryView.
+    works is an optional dict of prefetched records from prefetch_dois(),
+    log the logger (usually an EntryLogAdapter) for messages about the entry,
+    and responses the run's ResponseCache.
+    Returns a tuple of (doi, metadata_dict) where metadata_dict contains updated fields.
+    """
+    # Existing DOI: verify it with a direct lookup before falling back to a search
+    if view.doi:
+        doi_key = view.doi.lower()
+        if works is not None and doi_key in works:
+            item = works[doi_key]
+        else:
+            try:
+                item = lookup_doi(session, view.doi, limiter, log, responses)
+            except (requests.exceptions.RequestException, ValueError) as e:
+                # A search would most likely fail the same way, so keep the entry as it is
+                log.error(f"  ❌ Could not verify existing DOI, API request error: {e}")
+                return None, None
+        if item and item.get('title') and item.get('DOI'):
+            title_similarity = title_similarities(view.title_lc, [item['title'][0]])[0]
+            if title_similarity >= similarity_threshold:
+                log.debug(f"  Confirmed existing DOI (title score: {title_similarity:.2f}): {item['title'][0][:60]}...")
+                return item['DOI'], extract_metadata(item)
+            log.warning(f"  ⚠️  Existing DOI points to a different title (score: {title_similarity:.2f}), searching instead")
+        else:
+            log.warning(f"  ⚠️  Existing DOI not found on Crossref, searching instead")
+    
+    # Build initial query with title, made more specific with the first author if possible
+    query = view.title
+    if view.first_author_lastname:
+        query = f"{view.first_author_lastname} {view.title}"
     
-    # Prepare API call
-    base_url = 'https://api.crossref.org/works'
+    log.debug(f"  Searching Crossref for: {query[:60]}...")
+    
+    # Prepare API call; Crossref search is case-insensitive, so lowercase the
+    # query to let differently capitalized duplicates share one request
     params = {
-        'query.bibliographic': query,
+        'query.bibliographic': query.lower(),
         'rows': max_results,
+        'select': CROSSREF_SELECT_FIELDS,
     }
     
     # Add filters if available
-    if year:
-        params['filter'] = f'from-pub-date:{year},until-pub-date:{year}'
+    if view.year:
+        params['filter'] = f'from-pub-date:{view.year},until-pub-date:{view.year}'
     
     # Make API request
-    headers = {'User-Agent': 'BibtexFixer/6.0 (mailto:example@example.com)'}
-    
     try:
-        response = requests.get(base_url, params=params, headers=headers)
-        response.raise_for_status()
-        data = response.json()
+        message = crossref_get_message(session, CROSSREF_WORKS_URL, params, limiter, log, responses)
         
         # Print number of results found
-        total_results = data['message']['total-results']
-        print(f"  Found {total_results} potential matches from Crossref")
+        total_results = message['total-results']
+        log.debug(f"  Found {total_results} potential matches from Crossref")
         
         # Check if we got any results
         if total_results == 0:
-            print(f"  ⚠️  WARNING: No matches found for this entry!")
+            log.warning(f"  ⚠️  WARNING: No matches found for this entry!")
             return None, None
         
         # Process results to find best match
@@ -82,108 +522,58 @@ def get_doi_from_crossref(entry, similarity_threshold=0.75, max_results=10):
         best_similarity = 0
         best_metadata = {}
         
-        for item in data['message']['items']:
-            if 'title' not in item or not item['title']:
+        items = [item for item in message['items'] if item.get('title')]
+        title_scores = title_similarities(view.title_lc, [item['title'][0] for item in items])
+        
+        for item, current_similarity in zip(items, title_scores):
+            current_title = item['title'][0]
+            
+            # Get DOI
+            current_doi = item.get('DOI')
+            if not current_doi:
                 continue
             
-            current_title = item['title'][0]
-            current_similarity = similar(title, current_title)
+            # Skip the author comparison if even a perfect author match
+            # could not beat the best score so far
+            if (current_similarity * 0.7) + 0.3 <= best_similarity:
+                continue
             
             # If we have authors, check if they match to improve accuracy
             author_match = 1.0
-            if authors and 'author' in item:
+            if view.authors and 'author' in item:
                 item_authors = [f"{a.get('given', '')} {a.get('family', '')}" for a in item['author']]
-                author_matches = []
-                for author in authors:
-                    best_author_match = max([similar(author, ia) for ia in item_authors] or [0])
-                    author_matches.append(best_author_match)
-                if author_matches:
-                    author_match = sum(author_matches) / len(author_matches)
+                item_author_keys = [name_key(item_author) for item_author in item_authors]
+                author_match = author_match_score(view.author_keys, item_author_keys)
             
             # Combined score - more weight on title but author match matters
             combined_score = (current_similarity * 0.7) + (author_match * 0.3)
             
-            # Get DOI
-            current_doi = item.get('DOI')
-            
-            if combined_score > best_similarity and current_doi:
+            if combined_score > best_similarity:
                 best_similarity = combined_score
                 best_match = current_doi
                 
-                # Extract metadata fields from Crossref
-                metadata = {}
-                # Title
-                metadata['title'] = current_title
-                
-                # Journal/container title
-                if 'container-title' in item and item['container-title']:
-                    metadata['journal'] = item['container-title'][0]
-                
-                # Volume
-                if 'volume' in item:
-                    metadata['volume'] = item['volume']
-                
-                # Issue/Number
-                if 'issue' in item:
-                    metadata['number'] = item['issue']
-                
-                # Pages
-                if 'page' in item:
-                    metadata['pages'] = item['page'].replace('-', '--')  # BibTeX format
-                
-                # Year
-                if 'published-print' in item and 'date-parts' in item['published-print']:
-                    metadata['year'] = str(item['published-print']['date-parts'][0][0])
-                elif 'published-online' in item and 'date-parts' in item['published-online']:
-                    metadata['year'] = str(item['published-online']['date-parts'][0][0])
-                elif 'created' in item and 'date-parts' in item['created']:
-                    metadata['year'] = str(item['created']['date-parts'][0][0])
+                best_metadata = extract_metadata(item)
+                log.debug(f"  Found potential match (score: {combined_score:.2f}): {current_title[:60]}...")
                 
-                # Publisher
-                if 'publisher' in item:
-                    metadata['publisher'] = item['publisher']
-                
-                # Book title (for conference papers)
-                if 'event' in item and item['event'].get('name'):
-                    metadata['booktitle'] = item['event']['name']
-                
-                # Type - map to BibTeX entry type
-                if 'type' in item:
-                    type_mapping = {
-                        'journal-article': 'article',
-                        'proceedings-article': 'inproceedings',
-                        'book-chapter': 'incollection',
-                        'book': 'book',
-                        'edited-book': 'book',
-                        'monograph': 'book',
-                        'report': 'techreport',
-                        'dissertation': 'phdthesis'
-                    }
-                    if item['type'] in type_mapping:
-                        metadata['ENTRYTYPE'] = type_mapping[item['type']]
-                
-                # URL
-                if 'URL' in item:
-                    metadata['url'] = item['URL']
-                
-                best_metadata = metadata
-                print(f"  Found potential match (score: {combined_score:.2f}): {current_title[:60]}...")
+                # Crossref ranks by relevance, so a near-perfect match will not be beaten
+                if best_similarity >= EARLY_EXIT_SCORE:
+                    break
         
         # Only return if we're confident in the match
         if best_similarity >= similarity_threshold:
             return best_match, best_metadata
             
-        print(f"  ⚠️  WARNING: Best match score ({best_similarity:.2f}) is below threshold ({similarity_threshold})!")
-        print(f"  ⚠️  Match not accepted: \"{best_metadata.get('title', '')}\"")
+        log.warning(f"  ⚠️  WARNING: Best match score ({best_similarity:.2f}) is below threshold ({similarity_threshold})!")
+        log.warning(f"  ⚠️  Match not accepted: \"{best_metadata.get('title', '')}\"")
         return None, None
         
-    except requests.exceptions.RequestException as e:
-        print(f"  ❌ API request error: {e}")
+    except (requests.exceptions.RequestException, ValueError) as e:
+        log.error(f"  ❌ API request error: {e}")
         return None, None
 
-def update_entry_with_metadata(entry, metadata):
+def update_entry_with_metadata(entry, metadata, log=logger):
     """
-    Update entry with metadata from Crossref.
+    Update entry with metadata from Crossref, logging each change to log.
     Returns a tuple of (updated_entry, fields_updated).
     """
     fields_updated = []
@@ -204,7 +594,7 @@ def update_entry_with_metadata(entry, metadata):
                     entry[field] = metadata[field]
                 
                 fields_updated.append(field)
-                print(f"  Updated {field}: '{old_value}' -> '{metadata[field]}'")
+                log.debug(f"  Updated {field}: '{old_value}' -> '{metadata[field]}'")
     
     # Handle entry type update if relevant
     if 'ENTRYTYPE' in metadata and metadata['ENTRYTYPE']:
@@ -212,11 +602,73 @@ def update_entry_with_metadata(entry, metadata):
             old_type = entry['ENTRYTYPE']
             entry['ENTRYTYPE'] = metadata['ENTRYTYPE']
             fields_updated.append('ENTRYTYPE')
-            print(f"  Updated entry type: {old_type} -> {metadata['ENTRYTYPE']}")
+            log.debug(f"  Updated entry type: {old_type} -> {metadata['ENTRYTYPE']}")
     
     return entry, fields_updated
 
-def process_bibliography(input_file, output_file, remove_fields=None, similarity_threshold=0.75):
+def has_trusted_doi(view, skip_if_doi):
+    """Check whether an entry's existing DOI should be trusted without a Crossref lookup."""
+    return bool(skip_if_doi and view.doi and DOI_RE.match(view.doi))
+
+def process_entry(session, limiter, entry, view, position, total_entries, remove_fields, similarity_threshold,
+                  skip_if_doi=False, works=None, responses=None):
+    """
+    Process a single entry: look it up on Crossref, update its fields and
+    remove the requested ones. view is the entry's EntryView.
+    Safe to run from several worker threads.
+    With skip_if_doi, entries with a well-formed DOI are not looked up.
+    Returns a tuple of (entry, fields_updated, skipped).
+    """
+    entry_id = entry.get('ID', 'Unknown ID')
+    log = EntryLogAdapter(logger, {'label': f"[{position}/{total_entries}] {entry_id}"})
+    
+    # Check if DOI already exists
+    existing_doi = view.doi
+    if existing_doi:
+        log.debug(f"  Existing DOI: {existing_doi}")
+    
+    # Get DOI and metadata from Crossref, unless the existing DOI is trusted
+    skipped = has_trusted_doi(view, skip_if_doi)
+    if skipped:
+        log.debug(f"  Trusting existing DOI, skipping Crossref lookup")
+        crossref_doi, metadata = None, None
+    else:
+        crossref_doi, metadata = get_doi_from_crossref(session, view, similarity_threshold, limiter=limiter,
+                                                       works=works, log=log, responses=responses)
+    
+    # Update with metadata if found
+    fields_updated = []
+    if crossref_doi:
+        if not existing_doi or existing_doi.lower() != crossref_doi.lower():
+            entry['doi'] = crossref_doi
+            fields_updated.append('doi')
+            log.debug(f"  Updated DOI: {crossref_doi}")
+        
+        # Update other fields with Crossref metadata
+        if metadata:
+            entry, updated_fields = update_entry_with_metadata(entry, metadata, log)
+            fields_updated.extend(updated_fields)
+    
+    # Remove specified fields
+    for field in remove_fields:
+        if field in entry:
+            del entry[field]
+            log.debug(f"  Removed field: {field}")
+            fields_updated.append(f"removed:{field}")
+    
+    if fields_updated:
+        logger.info(f"✅ [{position}/{total_entries}] {entry_id}: Updated {len(fields_updated)} fields: "
+                    f"{', '.join(fields_updated)}")
+    elif skipped:
+        logger.info(f"⏭️  [{position}/{total_entries}] {entry_id}: Kept existing DOI, Crossref lookup skipped")
+    else:
+        logger.warning(f"⚠️  [{position}/{total_entries}] {entry_id}: WARNING: No changes were made to this entry!\n"
+                       f"  ⚠️  This may indicate an issue with matching or the entry already being complete.")
+    
+    return entry, fields_updated, skipped
+
+def process_bibliography(input_file, output_file, remove_fields=None, similarity_threshold=0.75, max_workers=8,
+                         cache_file=None, skip_if_doi=False):
     """
     Main function to process bibliography:
     1. Add DOIs
@@ -232,89 +684,84 @@ def process_bibliography(input_file, output_file, remove_fields=None, similarity
     with open(input_file, 'r', encoding='utf-8') as bibtex_file:
         bib_database = bibtexparser.load(bibtex_file)
     
-    processed = 0
     total_entries = len(bib_database.entries)
+    
+    # Parse the fields used for the lookup once per entry
+    views = [EntryView.from_entry(entry) for entry in bib_database.entries]
+    
     entries_updated = 0
     entries_warning = 0
+    entries_skipped = 0
     
-    # Create a list to collect entries with potential issues
+    # Create a list to collect the BibTeX of entries with potential issues
     potential_issue_entries = []
+    issues_file = 'potential_issues.bib'
     
-    # Process each entry
-    for entry in bib_database.entries:
-        processed += 1
-        print(f"\nProcessing entry {processed}/{total_entries}: {entry.get('ID', 'Unknown ID')}")
-        
-        # Check if DOI already exists
-        existing_doi = entry.get('doi')
-        if existing_doi:
-            print(f"  Existing DOI: {existing_doi}")
-        
-        # Get DOI and metadata from Crossref
-        crossref_doi, metadata = get_doi_from_crossref(entry, similarity_threshold)
-        
-        # Update with metadata if found
-        fields_updated = []
-        if crossref_doi:
-            if not existing_doi or existing_doi.lower() != crossref_doi.lower():
-                entry['doi'] = crossref_doi
-                fields_updated.append('doi')
-                print(f"  Updated DOI: {crossref_doi}")
-            
-            # Update other fields with Crossref metadata
-            if metadata:
-                entry, updated_fields = update_entry_with_metadata(entry, metadata)
-                fields_updated.extend(updated_fields)
-        
-        # Remove specified fields
-        for field in remove_fields:
-            if field in entry:
-                del entry[field]
-                print(f"  Removed field: {field}")
-                fields_updated.append(f"removed:{field}")
-        
-        if fields_updated:
-            entries_updated += 1
-            print(f"  ✅ Updated {len(fields_updated)} fields: {', '.join(fields_updated)}")
-        else:
-            entries_warning += 1
-            print(f"  ⚠️  WARNING: No changes were made to this entry!")
-            print(f"  ⚠️  This may indicate an issue with matching or the entry already being complete.")
-            
-            # Add entry to potential issues list
-            potential_issue_entries.append(entry.copy())
-        
-        # Rate limiting to be nice to the API
-        if processed < total_entries:
-            time.sleep(1)
-    
-    # Write to output file
+    # Entries are written in input order as soon as they are processed
     writer = BibTexWriter()
     writer.indent = '  '
     writer.comma_first = False
+    writer.order_entries_by = None
     
-    with open(output_file, 'w', encoding='utf-8') as bibtex_file:
+    # Reuse one HTTP session (keep-alive) for all Crossref queries and
+    # share one rate limiter and one response cache between the worker threads
+    limiter = RateLimiter()
+    responses = ResponseCache()
+    with open(output_file, 'w', encoding='utf-8') as bibtex_file, \
+            create_session(cache_file, max_workers) as session, \
+            ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # Comments, preambles and strings go before the entries
+        writer.contents = ['comments', 'preambles', 'strings']
         bibtex_file.write(writer.write(bib_database))
+        
+        # Fetch the records of existing DOIs in batches instead of one request per entry
+        works = prefetch_dois(session, [view.doi for view in views
+                                        if view.doi and not has_trusted_doi(view, skip_if_doi)],
+                              limiter, executor, responses=responses)
+        
+        results = executor.map(
+            lambda position, entry, view: process_entry(session, limiter, entry, view, position, total_entries,
+                                                        remove_fields, similarity_threshold, skip_if_doi, works,
+                                                        responses),
+            range(1, total_entries + 1),
+            bib_database.entries,
+            views
+        )
+        
+        # Results come back in input order
+        for position, (entry, fields_updated, skipped) in enumerate(results, 1):
+            if position > 1:
+                bibtex_file.write(writer.entry_separator)
+            entry_bibtex = writer._entry_to_bibtex(entry)
+            bibtex_file.write(entry_bibtex)
+            
+            if fields_updated:
+                entries_updated += 1
+            elif skipped:
+                entries_skipped += 1
+            else:
+                entries_warning += 1
+                
+                # Add entry to potential issues list, reusing its serialized form
+                potential_issue_entries.append(entry_bibtex)
     
     # Write potential issues to a separate file
     if potential_issue_entries:
-        issues_db = bibtexparser.bibdatabase.BibDatabase()
-        issues_db.entries = potential_issue_entries
-        
-        issues_file = 'potential_issues.bib'
         with open(issues_file, 'w', encoding='utf-8') as bibtex_file:
-            bibtex_file.write(writer.write(issues_db))
+            bibtex_file.write(writer.entry_separator.join(potential_issue_entries))
     
-    print(f"\nProcessing complete!")
-    print(f"✅ Updated {entries_updated} of {total_entries} entries.")
-    print(f"⚠️  {entries_warning} entries had no changes (potential issues).")
-    print(f"Output saved to {output_file}")
+    logger.info(f"\nProcessing complete!")
+    logger.info(f"✅ Updated {entries_updated} of {total_entries} entries.")
+    if entries_skipped:
+        logger.info(f"⏭️  {entries_skipped} entries kept their existing DOI without a Crossref lookup.")
+    logger.info(f"⚠️  {entries_warning} entries had no changes (potential issues).")
+    logger.info(f"Output saved to {output_file}")
     
     if entries_warning > 0:
-        print(f"⚠️  {entries_warning} entries with potential issues saved to {issues_file}")
-        print("\n⚠️  WARNING: Some entries had no changes applied!")
-        print("    Consider reviewing these entries manually or adjusting the similarity threshold.")
-        print("    Try running with --threshold 0.65 to be more lenient with matching.")
+        logger.info(f"⚠️  {entries_warning} entries with potential issues saved to {issues_file}")
+        logger.warning("\n⚠️  WARNING: Some entries had no changes applied!")
+        logger.warning("    Consider reviewing these entries manually or adjusting the similarity threshold.")
+        logger.warning("    Try running with --threshold 0.65 to be more lenient with matching.")
 
 def main():
     """Parse arguments and run the script."""
@@ -325,24 +772,63 @@ def main():
                         help='List of fields to remove (default: organization abstract keywords)')
     parser.add_argument('--threshold', type=float, default=0.75,
                         help='Similarity threshold for accepting matches (0.0-1.0, default: 0.75)')
+    parser.add_argument('--cache', default='crossref_cache.sqlite',
+                        help='File for caching Crossref responses between runs, requires requests-cache '
+                             '(default: crossref_cache.sqlite)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Do not cache Crossref responses on disk')
+    parser.add_argument('--workers', type=int, default=8,
+                        help='Number of entries looked up on Crossref concurrently (default: 8)')
+    parser.add_argument('--skip-if-doi', action='store_true',
+                        help='Do not query Crossref for entries that already have a well-formed DOI; '
+                             'much faster on mostly complete bibliographies, but those DOIs and their '
+                             'metadata are not verified or updated')
+    verbosity = parser.add_mutually_exclusive_group()
+    verbosity.add_argument('-v', '--verbose', action='store_true',
+                           help='Show detailed progress for every entry')
+    verbosity.add_argument('-q', '--quiet', action='store_true',
+                           help='Only show warnings and errors')
     
     args = parser.parse_args()
+    if args.workers < 1:
+        parser.error('--workers must be at least 1')
+    
+    # One handler for all output; its lock keeps lines from worker threads intact
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(handler)
+    if args.verbose:
+        logger.setLevel(logging.DEBUG)
+    elif args.quiet:
+        logger.setLevel(logging.WARNING)
+    else:
+        logger.setLevel(logging.INFO)
     
     # Add timestamp and version info to output
-    print(f"BibTeX Bibliography DOI Fixer - Version 6.0")
-    print(f"Run by: southnt")
-    print(f"Date: {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC")
-    print(f"Input file: {args.input_file}")
-    print(f"Output file: {args.output_file}")
-    print(f"Similarity threshold: {args.threshold}")
-    print(f"Fields to remove: {', '.join(args.remove)}")
-    print("-" * 60)
+    logger.info(f"BibTeX Bibliography DOI Fixer - Version 6.0")
+    logger.info(f"Run by: southnt")
+    logger.info(f"Date: {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC")
+    logger.info(f"Input file: {args.input_file}")
+    logger.info(f"Output file: {args.output_file}")
+    logger.info(f"Similarity threshold: {args.threshold}")
+    logger.info(f"Fields to remove: {', '.join(args.remove)}")
+    
+    cache_file = None if args.no_cache else args.cache
+    if cache_file and not requests_cache:
+        logger.info("Crossref cache: disabled (install requests-cache to enable)")
+        cache_file = None
+    else:
+        logger.info(f"Crossref cache: {cache_file or 'disabled'}")
+    logger.info("-" * 60)
     
     process_bibliography(
         args.input_file, 
         args.output_file, 
         args.remove, 
-        args.threshold
+        args.threshold,
+        cache_file=cache_file,
+        max_workers=args.workers,
+        skip_if_doi=args.skip_if_doi
     )
 
 if __name__ == "__main__":
@@ -0,0 +1,274 @@
+"""Tests for the Crossref request helpers in fix_bibliography."""
+
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import fix_bibliography
+
+
+class TooManyRequestsHandler(BaseHTTPRequestHandler):
+    """Answers every request with 429 and a zero Retry-After."""
+    requests_seen = 0
+
+    def do_GET(self):
+        type(self).requests_seen += 1
+        self.send_response(429)
+        self.send_header('Retry-After', '0')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class WorksHandler(BaseHTTPRequestHandler):
+    """Answers every request with an empty Crossref search result."""
+    requests_seen = 0
+
+    def do_GET(self):
+        type(self).requests_seen += 1
+        body = b'{"message": {"total-results": 0, "items": []}}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class DoiFilterHandler(BaseHTTPRequestHandler):
+    """
+    Answers filter=doi:... queries with the records it knows, and 400 for any
+    batch that asks for a DOI ending in /fail. Records the request paths.
+    """
+    known = {'10.1234/known': {'DOI': '10.1234/KNOWN', 'title': ['Machine Learning Applications']}}
+    paths = []
+
+    def do_GET(self):
+        type(self).paths.append(self.path)
+        query = parse_qs(urlparse(self.path).query)
+        dois = [value[4:] for value in query.get('filter', [''])[0].split(',')]
+        if any(doi.endswith('/fail') for doi in dois):
+            self.send_response(400)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        items = [self.known[doi] for doi in dois if doi in self.known]
+        body = json.dumps({'message': {'total-results': len(items), 'items': items}}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class CountingLimiter(fix_bibliography.RateLimiter):
+    def __init__(self):
+        super().__init__()
+        self.acquired = 0
+
+    def acquire(self):
+        self.acquired += 1
+        super().acquire()
+
+
+class ParseIntervalTest(unittest.TestCase):
+    def test_units(self):
+        self.assertEqual(fix_bibliography.parse_interval('1s'), 1)
+        self.assertEqual(fix_bibliography.parse_interval('2m'), 120)
+        self.assertEqual(fix_bibliography.parse_interval('1h'), 3600)
+        self.assertEqual(fix_bibliography.parse_interval(' 3 '), 3)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            fix_bibliography.parse_interval('soon')
+
+
+class RetryAfterSecondsTest(unittest.TestCase):
+    def test_seconds(self):
+        self.assertEqual(fix_bibliography.retry_after_seconds({'Retry-After': '3'}, 1), 3)
+
+    def test_missing_or_invalid(self):
+        self.assertEqual(fix_bibliography.retry_after_seconds({}, 7), 7)
+        self.assertEqual(fix_bibliography.retry_after_seconds({'Retry-After': 'junk'}, 4), 4)
+
+    def test_http_date(self):
+        future = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)
+        delay = fix_bibliography.retry_after_seconds({'Retry-After': future}, 1)
+        self.assertTrue(25 <= delay <= 30)
+        past = format_datetime(datetime.now(timezone.utc) - timedelta(days=1), usegmt=True)
+        self.assertEqual(fix_bibliography.retry_after_seconds({'Retry-After': past}, 1), 0)
+
+
+class LocalServerTestCase(unittest.TestCase):
+    """Runs handler on a local server and points a Crossref session at it."""
+    handler = None
+    cache_file = None
+
+    def setUp(self):
+        self.handler.requests_seen = 0
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self.handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/works'
+        self.session = fix_bibliography.create_session(self.cache_file)
+        # Use the Crossref adapter (and its retry policy) for the local server
+        self.session.mount('http://', self.session.get_adapter('https://api.crossref.org'))
+
+    def tearDown(self):
+        self.session.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class CrossrefGetTest(LocalServerTestCase):
+    handler = TooManyRequestsHandler
+
+    def test_429_is_only_retried_by_crossref_get(self):
+        limiter = fix_bibliography.RateLimiter()
+        response = fix_bibliography.crossref_get(self.session, self.url, limiter=limiter)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(TooManyRequestsHandler.requests_seen, fix_bibliography.RATE_LIMIT_RETRIES + 1)
+
+    def test_429_pauses_the_limiter(self):
+        limiter = fix_bibliography.RateLimiter()
+        pauses = []
+        limiter.pause = pauses.append
+        fix_bibliography.crossref_get(self.session, self.url, limiter=limiter)
+        self.assertEqual(pauses, [0.0] * fix_bibliography.RATE_LIMIT_RETRIES)
+
+
+@unittest.skipUnless(fix_bibliography.requests_cache, 'requests-cache is not installed')
+class CachedCrossrefGetTest(LocalServerTestCase):
+    handler = WorksHandler
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache_file = os.path.join(self.tmpdir.name, 'crossref_cache.sqlite')
+        super().setUp()
+
+    def tearDown(self):
+        super().tearDown()
+        self.tmpdir.cleanup()
+
+    def test_cache_hits_skip_the_limiter(self):
+        limiter = CountingLimiter()
+        params = {'query.bibliographic': 'smith machine learning'}
+        first = fix_bibliography.crossref_get(self.session, self.url, params, limiter)
+        second = fix_bibliography.crossref_get(self.session, self.url, params, limiter)
+        self.assertEqual((first.status_code, second.status_code), (200, 200))
+        self.assertTrue(second.from_cache)
+        self.assertEqual(WorksHandler.requests_seen, 1)
+        self.assertEqual(limiter.acquired, 1)
+
+
+class PrefetchDoisTest(LocalServerTestCase):
+    handler = DoiFilterHandler
+
+    def setUp(self):
+        DoiFilterHandler.paths = []
+        super().setUp()
+        self.original_url = fix_bibliography.CROSSREF_WORKS_URL
+        fix_bibliography.CROSSREF_WORKS_URL = self.url
+
+    def tearDown(self):
+        fix_bibliography.CROSSREF_WORKS_URL = self.original_url
+        super().tearDown()
+
+    def prefetch(self):
+        dois = ['10.1234/Known', '10.1234/missing', '10.1234/KNOWN', '10.1234/zz/fail', '10.1234/a,b']
+        with self.assertLogs('fix_bib', 'ERROR'):
+            return fix_bibliography.prefetch_dois(self.session, dois, batch_size=2)
+
+    def test_maps_lowercased_dois(self):
+        works = self.prefetch()
+        self.assertEqual(works, {'10.1234/known': DoiFilterHandler.known['10.1234/known'],
+                                 '10.1234/missing': None})
+        # [known, missing] and the failing [zz/fail]; the DOI with a comma is not sent
+        self.assertEqual(len(DoiFilterHandler.paths), 2)
+        self.assertNotIn('a%2Cb', ''.join(DoiFilterHandler.paths))
+
+    def test_prefetched_record_is_used(self):
+        works = self.prefetch()
+        DoiFilterHandler.paths = []
+        entry = {'ID': 'smith2019', 'title': 'Machine learning applications', 'doi': '10.1234/Known'}
+        view = fix_bibliography.EntryView.from_entry(entry)
+        doi, metadata = fix_bibliography.get_doi_from_crossref(self.session, view, works=works)
+        self.assertEqual(doi, '10.1234/KNOWN')
+        self.assertEqual(metadata['title'], 'Machine Learning Applications')
+        self.assertEqual(DoiFilterHandler.paths, [])
+
+
+class ResponseCacheTest(unittest.TestCase):
+    def test_fetches_each_key_once(self):
+        responses = fix_bibliography.ResponseCache()
+        calls = []
+        fetch = lambda: calls.append(1) or {'items': []}
+        self.assertEqual(responses.get('a', fetch), {'items': []})
+        self.assertEqual(responses.get('a', fetch), {'items': []})
+        self.assertEqual(len(calls), 1)
+
+    def test_failed_fetch_is_not_cached(self):
+        responses = fix_bibliography.ResponseCache()
+        def fail():
+            raise ValueError('bad response')
+        with self.assertRaises(ValueError):
+            responses.get('a', fail)
+        self.assertEqual(responses.get('a', lambda: 'ok'), 'ok')
+
+    def test_caches_are_independent(self):
+        fix_bibliography.ResponseCache().get('a', lambda: 'first run')
+        self.assertEqual(fix_bibliography.ResponseCache().get('a', lambda: 'second run'), 'second run')
+
+
+class OfflineSession:
+    """Fails every request the way requests does without a network."""
+    def __init__(self):
+        self.urls = []
+
+    def get(self, url, **kwargs):
+        self.urls.append(url)
+        raise fix_bibliography.requests.exceptions.ConnectionError('offline')
+
+
+class ExistingDoiLookupTest(unittest.TestCase):
+    def setUp(self):
+        entry = {'ID': 'smith2019', 'title': 'Machine Learning', 'doi': '10.1234/jml.2019'}
+        self.view = fix_bibliography.EntryView.from_entry(entry)
+
+    def test_failed_lookup_raises(self):
+        with self.assertRaises(fix_bibliography.requests.exceptions.RequestException):
+            fix_bibliography.lookup_doi(OfflineSession(), '10.1234/jml.2019')
+
+    def test_failed_lookup_skips_the_search(self):
+        session = OfflineSession()
+        with self.assertLogs('fix_bib', 'ERROR') as logs:
+            result = fix_bibliography.get_doi_from_crossref(session, self.view)
+        self.assertEqual(result, (None, None))
+        self.assertEqual(session.urls, [f'{fix_bibliography.CROSSREF_WORKS_URL}/10.1234/jml.2019'])
+        self.assertIn('Could not verify existing DOI', logs.output[0])
+
+
+class RateLimiterTest(unittest.TestCase):
+    def test_pause_holds_back_acquire(self):
+        limiter = fix_bibliography.RateLimiter()
+        limiter.pause(0.2)
+        start = time.monotonic()
+        limiter.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.15)
+
+
+if __name__ == '__main__':
+    unittest.main()